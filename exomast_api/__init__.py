@@ -1 +1,5 @@
-from .exomast_api import exoMAST_API
\ No newline at end of file
+from .exomast_api import exoMAST_API
+from .cache_backends import (CacheBackend, MemoryCache, DirectoryCache,
+                             SQLiteCache, RedisCache, get_cache_backend)
+from .spectra_comparison import exoMAST_SpectraComparison
+from .spectra_plots import exoMAST_SpectraRenderer, render_spectra_plots
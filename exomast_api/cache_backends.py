@@ -0,0 +1,273 @@
+import os
+import joblib
+import pickle
+import sqlite3
+import tempfile
+
+from contextlib import closing, contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Advisory locks are unavailable (e.g. Windows); rely on atomic renames
+    fcntl = None
+
+# Environment variables used by `get_cache_backend` to choose a backend
+CACHE_BACKEND_ENV = 'EXOMAST_API_CACHE'
+CACHE_LOCATION_ENV = 'EXOMAST_API_CACHE_LOCATION'
+
+
+def default_cache_dir():
+    """`~/.exomast_api`, resolved from HOME at call time."""
+    return os.environ.get('HOME', '.') + '/.exomast_api'
+
+
+@contextmanager
+def file_lock(filename, shared=False):
+    """Hold an advisory lock on `filename + '.lock'` for the duration of a
+    `with` block; shared locks for readers, exclusive locks for writers.
+    """
+    if fcntl is None:
+        yield
+        return
+
+    with open(filename + '.lock', 'a') as lockfile:
+        fcntl.flock(lockfile, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lockfile, fcntl.LOCK_UN)
+
+
+def atomic_dump(value, filename):
+    """`joblib.dump` to a temporary file in the same directory, then rename
+    it over `filename` so that readers never see a partial file.
+    """
+    dirname = os.path.dirname(filename) or '.'
+    fd, temp_filename = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+    try:
+        # mkstemp creates 0600 files; use the mode of a plain `open` instead
+        if hasattr(os, 'fchmod'):
+            umask = os.umask(0)
+            os.umask(umask)
+            os.fchmod(fd, 0o666 & ~umask)
+
+        with os.fdopen(fd, 'wb') as fout:
+            joblib.dump(value, fout)
+            fout.flush()
+            os.fsync(fout.fileno())
+
+        os.replace(temp_filename, filename)
+    except BaseException:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+        raise
+
+
+class CacheBackend(object):
+    """Key-value store for saved exoMAST_API instances.
+
+    Subclasses implement `get`, `set` and `delete`. `get` returns None for
+    a missing key and raises if a stored value cannot be read.
+    """
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+
+class MemoryCache(CacheBackend):
+    """Process-local cache; values are pickled so that cached instances do
+    not share mutable state. All instances share one store unless `store`
+    is given.
+    """
+
+    _shared_store = {}
+
+    def __init__(self, store=None):
+        self._store = self._shared_store if store is None else store
+
+    def get(self, key):
+        value = self._store.get(key)
+        return None if value is None else pickle.loads(value)
+
+    def set(self, key, value):
+        self._store[key] = pickle.dumps(value)
+
+    def delete(self, key):
+        self._store.pop(key, None)
+
+
+class DirectoryCache(CacheBackend):
+    """One joblib file per key in a local directory (the original
+    `~/.exomast_api` layout), written atomically under advisory locks and
+    read without locking.
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir or default_cache_dir()
+
+    def filename(self, key):
+        return '{}/{}'.format(self.cache_dir, key)
+
+    def get(self, key):
+        filename = self.filename(key)
+        if not os.path.exists(filename):
+            return None
+
+        # Writers replace files atomically, so readers need no lock; this
+        # also keeps read-only cache directories readable
+        return joblib.load(filename)
+
+    def set(self, key, value):
+        filename = self.filename(key)
+        # `exist_ok` avoids the mkdir race between concurrent workers
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        with file_lock(filename):
+            atomic_dump(value, filename)
+
+    def delete(self, key):
+        if not os.path.exists(self.cache_dir):
+            return
+
+        filename = self.filename(key)
+        with file_lock(filename):
+            if os.path.exists(filename):
+                os.remove(filename)
+
+
+class SQLiteCache(CacheBackend):
+    """Pickled values in a single SQLite database file. A connection is
+    opened per operation, so instances are safe to use after a fork.
+    """
+
+    def __init__(self, filename=None, timeout=30.):
+        self.filename = filename or \
+            default_cache_dir() + '/exomast_api.sqlite'
+        self.timeout = timeout
+
+        dirname = os.path.dirname(self.filename)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+
+        with self._connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS cache '
+                               '(key TEXT PRIMARY KEY, value BLOB)')
+
+    def _connect(self):
+        return closing(sqlite3.connect(self.filename, timeout=self.timeout,
+                                       isolation_level=None))
+
+    def get(self, key):
+        with self._connect() as connection:
+            row = connection.execute('SELECT value FROM cache WHERE key = ?',
+                                     (key,)).fetchone()
+
+        return None if row is None else pickle.loads(row[0])
+
+    def set(self, key, value):
+        with self._connect() as connection:
+            connection.execute('INSERT OR REPLACE INTO cache VALUES (?, ?)',
+                               (key, sqlite3.Binary(pickle.dumps(value))))
+
+    def delete(self, key):
+        with self._connect() as connection:
+            connection.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+
+class RedisCache(CacheBackend):
+    """Pickled values in a Redis server shared by many workers.
+
+    Any client with the `get`, `set` and `delete` methods of `redis.Redis`
+    can be passed as `client` (e.g. a local stand-in such as
+    `fakeredis.FakeRedis`); otherwise one is created from `url`. Clients are
+    not pickled: an unpickled RedisCache (e.g. in a worker process) creates
+    a new client from `url`.
+    """
+
+    def __init__(self, url=None, client=None, prefix='exomast_api:',
+                 expire=None):
+        self.url = url or 'redis://localhost:6379/0'
+        self.prefix = prefix
+        self.expire = expire
+
+        self.client = self._make_client() if client is None else client
+
+    def _make_client(self):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError('The redis cache backend requires the '
+                              '`redis` package: pip install redis')
+
+        return redis.Redis.from_url(self.url)
+
+    def __getstate__(self):
+        # Clients hold locks and sockets; rebuild them from `url` instead
+        state = self.__dict__.copy()
+        state['client'] = None
+
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.client is None:
+            self.client = self._make_client()
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return None if value is None else pickle.loads(value)
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, pickle.dumps(value),
+                        ex=self.expire)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+
+cache_backends = {'memory': MemoryCache,
+                  'directory': DirectoryCache,
+                  'sqlite': SQLiteCache,
+                  'redis': RedisCache}
+
+
+def get_cache_backend(backend=None, location=None, **kwargs):
+    """Return a cache backend by name, or pass through a CacheBackend.
+
+    If `backend` is None, the name is read from the `EXOMAST_API_CACHE`
+    environment variable (default 'directory') and `location` from
+    `EXOMAST_API_CACHE_LOCATION`: the directory, the SQLite filename or the
+    Redis URL, depending on the backend.
+    """
+    if isinstance(backend, CacheBackend):
+        return backend
+
+    if backend is None:
+        backend = os.environ.get(CACHE_BACKEND_ENV, 'directory')
+        location = location or os.environ.get(CACHE_LOCATION_ENV)
+
+    backend = backend.lower()
+    if backend not in cache_backends:
+        raise ValueError('cache backend must be one of {}'.format(
+            list(cache_backends.keys())))
+
+    if backend == 'memory':
+        return MemoryCache(**kwargs)
+
+    if backend == 'directory':
+        return DirectoryCache(location, **kwargs)
+
+    if backend == 'sqlite':
+        return SQLiteCache(location, **kwargs)
+
+    return RedisCache(location, **kwargs)
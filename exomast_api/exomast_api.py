@@ -1,13 +1,15 @@
 import os
-import joblib
 
 from astropy import units
+from hashlib import sha1
 from json import loads as jsonloads
 from json import load as jsonload
 from numpy import copy as npcopy
 from pandas import DataFrame
 from requests import get as requests_get, HTTPError
 
+from .cache_backends import DirectoryCache, get_cache_backend
+
 
 def info_message(*args, **kwargs):
     message = args[0]  # further arguments are redundant
@@ -27,6 +29,63 @@ def debug_message(*args, **kwargs):
     print(f'[DEBUG] {message}', end=end)
 
 
+def http_cache_key(request_url):
+    """Cache key for the downloaded content of `request_url`."""
+    return '{}.exomast.http.save'.format(
+        sha1(request_url.encode('utf-8')).hexdigest())
+
+
+def past_wavelength(wavelength_max):
+    """Return a `stop_line` callable for `exoMAST_API.request_content` that
+    is True for the first spectrum row beyond `wavelength_max`; this assumes
+    that the spectra files are sorted by increasing wavelength.
+    """
+    def stop_line(line):
+        line = line.strip()
+        if len(line) == 0 or line.startswith(b'#'):
+            return False
+
+        try:
+            return float(line.split()[0]) > wavelength_max
+        except ValueError:
+            return False
+
+    return stop_line
+
+
+def read_response(response, content=b'', stop_line=None,
+                  chunk_size=16384):
+    """Append the streamed body of `response` to `content`.
+
+    If `stop_line` is True for any complete line, reading stops there and
+    the content is truncated to the last complete line.
+
+    Returns:
+            content (bytes), complete (bool)
+    """
+    content = bytearray(content)
+    lines_end = content.rfind(b'\n') + 1
+
+    if stop_line is not None and \
+            any(stop_line(line) for line in content[:lines_end].split(b'\n')):
+        return bytes(content[:lines_end]), False
+
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        content.extend(chunk)
+
+        if stop_line is None:
+            continue
+
+        new_end = content.rfind(b'\n') + 1
+        new_lines = content[lines_end:new_end].split(b'\n')
+        if any(stop_line(line) for line in new_lines):
+            return bytes(content[:new_end]), False
+
+        lines_end = new_end
+
+    return bytes(content), True
+
+
 class exoMAST_API(object):
     """The summary line for a class docstring should fit on one line.
             If the class has public attributes, they may be documented here
@@ -57,7 +116,8 @@ class exoMAST_API(object):
     _collection = None
 
     def __init__(self, planet_name, exomast_version=0.1,
-                 api_url=default_url, verbose=False, quickstart=False):
+                 api_url=default_url, verbose=False, quickstart=False,
+                 cache=None):
         """Example of docstring on the __init__ method.
 
         The __init__ method may be documented in either the class level
@@ -92,6 +152,9 @@ class exoMAST_API(object):
         self.exomast_version = exomast_version
         self.verbose = verbose
 
+        # CacheBackend instance or name; see `cache_backends.get_cache_backend`
+        self.cache = get_cache_backend(cache)
+
         # self.get_canonical_name()
 
         # For use with `self.get_spectra`
@@ -114,18 +177,17 @@ class exoMAST_API(object):
             # Default behaviour to grab the planetary identifiers
             self.get_identifiers()
 
-            planet_name_ = self.planet_name.replace(' ', '_')
-            default_load_dir = os.environ['HOME'] + '/.exomast_api/'
-            load_filename = '{}.exomast.joblib.save'
-            load_filename = load_filename.format(planet_name_)
-            load_filename = '{}/{}'.format(default_load_dir, load_filename)
-
-            if os.path.exists(load_filename):
-                self.load_instance()
-            else:
+            # Fall back to a refetch if the save file is missing or corrupt
+            if not self.load_instance():
                 # Default behaviour to grab the planetary identifiers
                 self.get_properties()
-                self.save_instance()
+
+                try:
+                    self.save_instance()
+                except Exception as err:
+                    warning_message('Could not save results to the {} '
+                                    '({})'.format(
+                                        self.cache.__class__.__name__, err))
 
     def check_request(self, request_url, request_return):
         api_example_url = "https://exo.mast.stsci.edu/api/v0.1/exoplanets/"\
@@ -146,6 +208,107 @@ class exoMAST_API(object):
             raise HTTPError('{} generated the error:\n{}'.format(request_url,
                                                                  request_return))
 
+    def request_content(self, request_url, stop_line=None, use_cache=True):
+        """Download `request_url`, reusing cached content where possible.
+
+        Cached copies are revalidated with If-None-Match and
+        If-Modified-Since (304 -> cached copy). This covers complete copies
+        and partial copies (from an earlier `stop_line` download) that
+        already reach `stop_line`. Other partial copies are resumed with a
+        Range/If-Range request. Servers that ignore these headers return the
+        full payload, which is used instead. Requests ask for an
+        uncompressed (identity) body, so that Range offsets count the cached
+        bytes.
+
+        Args:
+                request_url (str): url to download.
+                stop_line (callable, optional): stop reading at the first
+                        line (bytes) for which this returns True.
+                use_cache (bool): read and store the content in `self.cache`.
+        Returns:
+                content of the response decoded as utf-8
+        """
+        cache_key = http_cache_key(request_url)
+
+        record = None
+        if use_cache:
+            try:
+                record = self.cache.get(cache_key)
+            except Exception as err:
+                warning_message('Ignoring unreadable cached copy of {} '
+                                '({})'.format(request_url, err))
+
+        covered = record is not None and (
+            record['complete'] or stop_line is not None and
+            any(stop_line(line) for line in record['content'].split(b'\n')))
+
+        headers = {'Accept-Encoding': 'identity'}
+        if record is not None:
+            validator = record['etag'] or record['last_modified']
+            if covered:
+                if record['etag']:
+                    headers['If-None-Match'] = record['etag']
+                if record['last_modified']:
+                    headers['If-Modified-Since'] = record['last_modified']
+            elif record['accept_ranges'] and validator:
+                headers['Range'] = 'bytes={}-'.format(len(record['content']))
+                headers['If-Range'] = validator
+
+        response = requests_get(request_url, headers=headers, stream=True)
+
+        if response.status_code == 416:
+            # Range not satisfiable; fall back to a full download
+            response.close()
+            record = None
+            response = requests_get(request_url, stream=True,
+                                    headers={'Accept-Encoding': 'identity'})
+
+        try:
+            if response.status_code == 304 and covered:
+                if self.verbose:
+                    info_message('Using cached copy of {}'.format(
+                        request_url))
+
+                content = record['content']
+            else:
+                prefix = b''
+                if response.status_code == 206 and record is not None:
+                    prefix = record['content']
+
+                content, complete = read_response(response, prefix,
+                                                  stop_line=stop_line)
+
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+
+                # Keep a complete copy rather than replace it with a partial
+                # one; a stale copy is replaced by the next full download
+                replace = record is None or complete or \
+                    not record['complete']
+
+                if use_cache and replace and response.ok and \
+                        (etag or last_modified):
+                    # Range offsets are only valid for uncompressed bodies
+                    accept_ranges = \
+                        'Content-Encoding' not in response.headers and \
+                        (response.status_code == 206 or
+                         response.headers.get('Accept-Ranges') == 'bytes')
+
+                    try:
+                        self.cache.set(cache_key,
+                                       {'etag': etag,
+                                        'last_modified': last_modified,
+                                        'accept_ranges': accept_ranges,
+                                        'complete': complete,
+                                        'content': content})
+                    except Exception as err:
+                        warning_message('Could not cache {} ({})'.format(
+                            request_url, err))
+        finally:
+            response.close()
+
+        return content.decode('utf-8')
+
     def get_identifiers(self, jsonfile=None, idx_list=0):
         """ Class methods are similar to regular functions.
 
@@ -293,20 +456,23 @@ class exoMAST_API(object):
             info_message('Acquiring Planetary Spectral File List from {}'.format(
                 planet_spec_fname_url))
 
-        spec_fname_request = requests_get(planet_spec_fname_url)
-        spec_fname_request = spec_fname_request.content.decode('utf-8')
+        spec_fname_request = self.request_content(planet_spec_fname_url)
 
         self.check_request(planet_spec_fname_url, spec_fname_request)
 
         self._spectra_filelist = jsonloads(spec_fname_request)
 
-    def get_spectra(self, idx_spec=0, header=None, caption=None):
+    def get_spectra(self, idx_spec=0, header=None, caption=None,
+                    wavelength_range=None):
         """Class methods are similar to regular functions.
         Note:
                 Do not include the `self` parameter in the ``Args`` section.
         Args:
                 param1: The first parameter.
                 param2: The second parameter.
+                wavelength_range (:obj:`tuple`, optional): (min, max) in
+                        microns; only rows inside this window are kept, and
+                        the download stops once it is passed.
         Returns:
                 True if successful, False otherwise.
         """
@@ -327,12 +493,29 @@ class exoMAST_API(object):
             info_message('Acquiring Planetary Spectral File List from {}'.format(
                 spectrum_request_url))
 
-        spectra_request = requests_get(spectrum_request_url)
-        spectra_request = spectra_request.content.decode('utf-8')
+        stop_line = None
+        if wavelength_range is not None:
+            wavelength_min, wavelength_max = wavelength_range
+            stop_line = past_wavelength(wavelength_max)
+
+        spectra_request = self.request_content(spectrum_request_url,
+                                               stop_line=stop_line)
+
+        spectra_table = []
+        for line in spectra_request.split('\n'):
+            if len(line) == 0 or line[0] == '#':
+                continue
 
-        spectra_table = [list(filter(lambda a: a != '', line.split(' ')))
-                         for line in spectra_request.split('\n')
-                         if len(line) > 0 and line[0] != '#']
+            row = list(filter(lambda a: a != '', line.split(' ')))
+
+            if wavelength_range is not None:
+                wavelength = float(row[0])
+                if wavelength > wavelength_max:
+                    break  # spectra are sorted by wavelength
+                if wavelength < wavelength_min:
+                    continue
+
+            spectra_table.append(row)
 
         self.planetary_spectra_table = DataFrame(spectra_table,
                                                  columns=header,
@@ -385,7 +568,7 @@ class exoMAST_API(object):
             info_message('Acquiring Planetary Threshold Crossing Database from {}'.format(
                 tce_url))
 
-        tce_request = requests_get(tce_url).content.decode('utf-8')
+        tce_request = self.request_content(tce_url)
 
         self.check_request(tce_url, tce_request)
 
@@ -420,9 +603,7 @@ class exoMAST_API(object):
             info_message('Accessing Meta Data from {}'.format(
                 planet_metadata_url))
 
-        planet_metadata_request = requests_get(planet_metadata_url)
-        planet_metadata_request = planet_metadata_request.content
-        planet_metadata_request = planet_metadata_request.decode('utf-8')
+        planet_metadata_request = self.request_content(planet_metadata_url)
 
         self.check_request(planet_metadata_url, planet_metadata_request)
 
@@ -457,8 +638,7 @@ class exoMAST_API(object):
             info_message('Acquiring Planetary Table from {}'.format(
                 planet_table_url))
 
-        planet_table_request = requests_get(planet_table_url)
-        planet_table_request = planet_table_request.content.decode('utf-8')
+        planet_table_request = self.request_content(planet_table_url)
 
         self.check_request(planet_table_url, planet_table_request)
 
@@ -495,11 +675,9 @@ class exoMAST_API(object):
             info_message('Acquiring Planetary Phase Plot from {}'.format(
                 planet_phaseplot_url))
 
-        planet_phplot_request = requests_get(planet_phaseplot_url)
-        planet_phaseplot_request = planet_phplot_request.content
-        planet_phplot_request = planet_phplot_request.decode('utf-8')
+        planet_phaseplot_request = self.request_content(planet_phaseplot_url)
 
-        self.check_request(planet_phaseplot_url, planet_phplot_request)
+        self.check_request(planet_phaseplot_url, planet_phaseplot_request)
 
         self.planet_phaseplot = jsonloads(planet_phaseplot_request)
         # planet_phaseplot_request
@@ -675,35 +853,55 @@ class exoMAST_API(object):
         self.print_table(table_name='property',
                          flt_fmt=flt_fmt, def_fmt=def_fmt, print_none=print_none, latex_style=latex_style, header=header, caption=caption, print_to_file=print_to_file)
 
-    def save_instance(self, save_dir=None, verbose=False):
-        default_save_dir = os.environ['HOME'] + '/.exomast_api'
-        save_dir = save_dir or default_save_dir
-        if not os.path.exists(save_dir):
-            os.mkdir(save_dir)
-
+    def instance_key(self):
         planet_name_ = self.planet_name.replace(' ', '_')
-        save_filename = '{}.exomast.joblib.save'.format(planet_name_)
-        save_filename = '{}/{}'.format(save_dir, save_filename)
+        return '{}.exomast.joblib.save'.format(planet_name_)
+
+    def save_instance(self, save_dir=None, verbose=False):
+        cache = DirectoryCache(save_dir) if save_dir else self.cache
+        save_key = self.instance_key()
 
         if self.verbose or verbose:
-            info_message('Saving Results to {}'.format(save_filename))
+            info_message('Saving Results as {} in {}'.format(
+                save_key, cache.__class__.__name__))
 
-        joblib.dump(self.__dict__, save_filename)
+        # The cache backend itself (e.g. a Redis client) is not saved
+        instance_dict = {key: val for key, val in self.__dict__.items()
+                         if key != 'cache'}
 
-    def load_instance(self, load_dir=None, verbose=False):
-        default_load_dir = os.environ['HOME'] + '/.exomast_api/'
-        load_dir = load_dir or default_load_dir
-        if not os.path.exists(load_dir):
-            os.mkdir(load_dir)
+        cache.set(save_key, instance_dict)
 
-        planet_name_ = self.planet_name.replace(' ', '_')
-        load_filename = '{}.exomast.joblib.save'.format(planet_name_)
-        load_filename = '{}/{}'.format(load_dir, load_filename)
+    def load_instance(self, load_dir=None, verbose=False):
+        """Load a saved instance; return False (leaving the instance
+        untouched) if the saved results are missing or cannot be read.
+        """
+        cache = DirectoryCache(load_dir) if load_dir else self.cache
+        load_key = self.instance_key()
 
         if self.verbose or verbose:
-            info_message('Loading Results from {}'.format(load_filename))
+            info_message('Loading Results as {} from {}'.format(
+                load_key, cache.__class__.__name__))
+
+        try:
+            instance_dict = cache.get(load_key)
+        except Exception as err:
+            warning_message('Could not load {} ({}); '
+                            'ignoring the saved results.'.format(
+                                load_key, err))
+            return False
+
+        if instance_dict is None:
+            return False
+
+        if not isinstance(instance_dict, dict):
+            warning_message('{} does not contain saved results; '
+                            'ignoring it.'.format(load_key))
+            return False
+
+        instance_dict['cache'] = self.cache
+        self.__dict__ = instance_dict
 
-        self.__dict__ = joblib.load(load_filename)
+        return True
 
 
 if __name__ == '__main__':
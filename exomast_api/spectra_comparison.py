@@ -0,0 +1,300 @@
+import numpy as np
+
+from .exomast_api import exoMAST_API, info_message, warning_message
+
+
+def stack_spectra(planets, header=None, idx_spec=0):
+    """Stack the transmission spectra of many planets into 2D arrays.
+
+    Spectra of different lengths are padded with NaN so that every planet
+    occupies one row of each output array.
+
+    Args:
+            planets (:obj:`list`): exoMAST_API instances or planet names.
+            header (:obj:`list` of :obj:`str`, optional): column names for the
+                    wavelength, depth, and uncertainty. Defaults to the
+                    `exoMAST_API.header` columns.
+            idx_spec (int): spectrum index passed to `get_spectra`.
+    Returns:
+            planet_names, wavelengths, depths, uncertainties
+    """
+    if len(planets) == 0:
+        raise ValueError('planets must contain at least one planet')
+
+    planets = [planet if isinstance(planet, exoMAST_API)
+               else exoMAST_API(planet) for planet in planets]
+
+    tables = []
+    for planet in planets:
+        if planet.planetary_spectra_table is None:
+            planet.get_spectra(idx_spec=idx_spec)
+
+        tables.append(planet.planetary_spectra_table)
+
+    if header is None:
+        header = list(planets[0].header)
+
+    if len(header) == 4:
+        # assume same order as exoMAST_API.header
+        header = [header[0], header[2], header[3]]
+
+    n_planets = len(tables)
+    n_max = max([len(table) for table in tables]) if n_planets else 0
+
+    wavelengths = np.full((n_planets, n_max), np.nan)
+    depths = np.full((n_planets, n_max), np.nan)
+    uncertainties = np.full((n_planets, n_max), np.nan)
+
+    for k, table in enumerate(tables):
+        n_k = len(table)
+        wavelengths[k, :n_k] = table[header[0]].values
+        depths[k, :n_k] = table[header[1]].values
+        uncertainties[k, :n_k] = table[header[2]].values
+
+    planet_names = [planet.planet_name for planet in planets]
+
+    return planet_names, wavelengths, depths, uncertainties
+
+
+def make_wavelength_grid(wavelengths, n_bins=25, xscale='log',
+                         overlap_only=True):
+    """Build the bin edges of a wavelength grid shared by all spectra.
+
+    Args:
+            wavelengths (:obj:`numpy.ndarray`): (n_planets, n_max) array,
+                    NaN padded.
+            n_bins (int): number of bins in the grid.
+            xscale (str): 'log' or 'linear' spacing of the bin edges.
+            overlap_only (bool): restrict the grid to the wavelength range
+                    covered by every planet; fall back to the full range when
+                    the spectra do not overlap.
+    Returns:
+            bin edges with shape (n_bins + 1,)
+    """
+    wave_min = np.nanmin(wavelengths, axis=1)
+    wave_max = np.nanmax(wavelengths, axis=1)
+
+    lower, upper = np.nanmin(wave_min), np.nanmax(wave_max)
+    if overlap_only:
+        if np.nanmax(wave_min) < np.nanmin(wave_max):
+            lower, upper = np.nanmax(wave_min), np.nanmin(wave_max)
+        else:
+            warning_message('Spectra do not overlap in wavelength; '
+                            'using the full wavelength range instead.')
+
+    if xscale == 'log':
+        return np.geomspace(lower, upper, n_bins + 1)
+
+    if xscale == 'linear':
+        return np.linspace(lower, upper, n_bins + 1)
+
+    raise ValueError("xscale must be either 'log' or 'linear'")
+
+
+def bin_spectra(wavelengths, depths, uncertainties, bin_edges):
+    """Resample stacked spectra onto a common grid with inverse-variance
+    weighted means.
+
+    All planets are binned together through a single `numpy.bincount` over
+    the flattened (planet, bin) index; points without a finite, positive
+    uncertainty are ignored.
+
+    Args:
+            wavelengths (:obj:`numpy.ndarray`): (n_planets, n_max) array.
+            depths (:obj:`numpy.ndarray`): (n_planets, n_max) array.
+            uncertainties (:obj:`numpy.ndarray`): (n_planets, n_max) array.
+            bin_edges (:obj:`numpy.ndarray`): (n_bins + 1,) array.
+    Returns:
+            bin_centers, binned_depths, binned_uncertainties, counts
+            where the binned arrays have shape (n_planets, n_bins) and empty
+            bins are NaN.
+    """
+    wavelengths = np.atleast_2d(wavelengths)
+    depths = np.atleast_2d(depths)
+    uncertainties = np.atleast_2d(uncertainties)
+    bin_edges = np.asarray(bin_edges, dtype=float)
+
+    n_planets = wavelengths.shape[0]
+    n_bins = bin_edges.size - 1
+
+    idx_bin = np.searchsorted(bin_edges, wavelengths, side='right') - 1
+    # include the upper edge in the last bin
+    idx_bin[wavelengths == bin_edges[-1]] = n_bins - 1
+
+    valid = np.isfinite(wavelengths) & np.isfinite(depths)
+    valid &= np.isfinite(uncertainties) & (uncertainties > 0)
+    valid &= (idx_bin >= 0) & (idx_bin < n_bins)
+
+    idx_planet = np.broadcast_to(np.arange(n_planets)[:, None],
+                                 wavelengths.shape)
+    idx_flat = (idx_planet * n_bins + idx_bin)[valid]
+
+    weights = uncertainties[valid] ** -2.
+    n_flat = n_planets * n_bins
+
+    sum_weights = np.bincount(idx_flat, weights=weights, minlength=n_flat)
+    sum_depths = np.bincount(idx_flat, weights=weights * depths[valid],
+                             minlength=n_flat)
+    counts = np.bincount(idx_flat, minlength=n_flat)
+
+    sum_weights = sum_weights.reshape(n_planets, n_bins)
+    sum_depths = sum_depths.reshape(n_planets, n_bins)
+    counts = counts.reshape(n_planets, n_bins)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        binned_depths = np.where(counts > 0, sum_depths / sum_weights, np.nan)
+        binned_uncs = np.where(counts > 0, sum_weights ** -0.5, np.nan)
+
+    bin_centers = 0.5 * (bin_edges[1:] + bin_edges[:-1])
+
+    return bin_centers, binned_depths, binned_uncs, counts
+
+
+def normalize_spectra(depths, uncertainties):
+    """Normalize each spectrum by its inverse-variance weighted mean depth
+    and compute the residuals against the weighted population spectrum.
+
+    Uncertainties are propagated to first order. The normalized
+    uncertainties include the uncertainty of each planet's mean depth and
+    its covariance with the depth being normalized. The residual
+    uncertainties include the uncertainty of the population spectrum and
+    its covariance with the planets that contribute to it; correlations
+    between the bins of one planet (through its shared mean) are neglected.
+
+    Args:
+            depths (:obj:`numpy.ndarray`): (n_planets, n_bins) array.
+            uncertainties (:obj:`numpy.ndarray`): (n_planets, n_bins) array.
+    Returns:
+            norm_depths, norm_uncertainties, mean_spectrum,
+            mean_uncertainties, residuals, residuals_sigma
+    """
+    depths_ = np.nan_to_num(depths, nan=0.)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weights = np.where(np.isfinite(depths), uncertainties ** -2., 0.)
+        weights = np.nan_to_num(weights, nan=0., posinf=0.)
+
+        sum_weights = weights.sum(axis=1)
+        planet_means = (weights * depths_).sum(axis=1) / sum_weights
+        planet_vars = 1. / sum_weights
+
+        norm_depths = depths / planet_means[:, None]
+
+        # var(d / m) with cov(d, m) = var(m) for an inverse-variance mean
+        norm_vars = (uncertainties ** 2. + planet_vars[:, None] *
+                     norm_depths * (norm_depths - 2.)) / \
+            planet_means[:, None] ** 2.
+        norm_uncs = np.sqrt(np.clip(norm_vars, 0., None))
+
+        norm_weights = np.where(np.isfinite(norm_depths),
+                                norm_uncs ** -2., 0.)
+        norm_weights = np.nan_to_num(norm_weights, nan=0., posinf=0.)
+        sum_norm_weights = norm_weights.sum(axis=0)
+        mean_spectrum = (norm_weights * np.nan_to_num(norm_depths, nan=0.)
+                         ).sum(axis=0) / sum_norm_weights
+        mean_vars = 1. / sum_norm_weights
+        mean_uncs = np.sqrt(mean_vars)
+
+        residuals = norm_depths - mean_spectrum[None, :]
+
+        # cov(n, M) = var(M) for planets included in the population mean
+        included = norm_weights > 0
+        residual_vars = np.where(included,
+                                 norm_uncs ** 2. - mean_vars[None, :],
+                                 norm_uncs ** 2. + mean_vars[None, :])
+        residuals_sigma = residuals / np.sqrt(np.clip(residual_vars, 0., None))
+
+    return (norm_depths, norm_uncs, mean_spectrum, mean_uncs,
+            residuals, residuals_sigma)
+
+
+class exoMAST_SpectraComparison(object):
+    """Compare the transmission spectra of many planets on a common
+    wavelength grid.
+
+    Attributes:
+            planet_names (:obj:`list` of :obj:`str`): canonical planet names.
+            wavelengths, depths, uncertainties (:obj:`numpy.ndarray`): stacked
+                    NaN-padded spectra with shape (n_planets, n_max).
+            bin_edges, bin_centers (:obj:`numpy.ndarray`): common grid.
+            binned_depths, binned_uncertainties (:obj:`numpy.ndarray`):
+                    resampled spectra with shape (n_planets, n_bins).
+            norm_depths, norm_uncertainties, residuals, residuals_sigma
+                    (:obj:`numpy.ndarray`): outputs of `normalize_spectra`.
+            mean_spectrum (:obj:`numpy.ndarray`): weighted population spectrum.
+            mean_uncertainties (:obj:`numpy.ndarray`): its uncertainties.
+    """
+
+    bin_edges = None
+    bin_centers = None
+    binned_depths = None
+    binned_uncertainties = None
+    bin_counts = None
+    norm_depths = None
+    norm_uncertainties = None
+    mean_spectrum = None
+    mean_uncertainties = None
+    residuals = None
+    residuals_sigma = None
+
+    def __init__(self, planets, header=None, idx_spec=0, verbose=False):
+        """
+        Args:
+                planets (:obj:`list`): exoMAST_API instances or planet names.
+                header (:obj:`list` of :obj:`str`, optional): spectra columns.
+                idx_spec (int): spectrum index passed to `get_spectra`.
+                verbose (bool): print progress messages.
+        """
+        self.verbose = verbose
+
+        if self.verbose:
+            info_message('Stacking spectra for {} planets'.format(
+                len(planets)))
+
+        stacked = stack_spectra(planets, header=header, idx_spec=idx_spec)
+        self.planet_names = stacked[0]
+        self.wavelengths = stacked[1]
+        self.depths = stacked[2]
+        self.uncertainties = stacked[3]
+
+    def resample(self, bin_edges=None, n_bins=25, xscale='log',
+                 overlap_only=True):
+        """Bin every spectrum onto the common grid `bin_edges`; build the grid
+        with `make_wavelength_grid` if it is not provided.
+        """
+        if bin_edges is None:
+            bin_edges = make_wavelength_grid(self.wavelengths, n_bins=n_bins,
+                                             xscale=xscale,
+                                             overlap_only=overlap_only)
+
+        if self.verbose:
+            info_message('Resampling spectra onto {} bins'.format(
+                len(bin_edges) - 1))
+
+        self.bin_edges = np.asarray(bin_edges, dtype=float)
+        binned = bin_spectra(self.wavelengths, self.depths,
+                             self.uncertainties, self.bin_edges)
+
+        self.bin_centers = binned[0]
+        self.binned_depths = binned[1]
+        self.binned_uncertainties = binned[2]
+        self.bin_counts = binned[3]
+
+    def compare(self, **kwargs):
+        """Resample (if needed) and compute normalized depths and residuals
+        for the whole set. `kwargs` are passed to `resample`.
+        """
+        if self.binned_depths is None or len(kwargs):
+            self.resample(**kwargs)
+
+        normed = normalize_spectra(self.binned_depths,
+                                   self.binned_uncertainties)
+
+        self.norm_depths = normed[0]
+        self.norm_uncertainties = normed[1]
+        self.mean_spectrum = normed[2]
+        self.mean_uncertainties = normed[3]
+        self.residuals = normed[4]
+        self.residuals_sigma = normed[5]
+
+        return self.residuals
@@ -0,0 +1,187 @@
+import os
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from .exomast_api import exoMAST_API, info_message, warning_message
+
+# One renderer per process, created lazily by `_render_chunk`
+_worker_renderer = None
+_worker_renderer_kwargs = None
+
+
+class exoMAST_SpectraRenderer(object):
+    """Render many planetary spectra plots through one reusable figure.
+
+    The figure is attached directly to the non-interactive Agg canvas (no
+    pyplot state), and the errorbar artists are created once and then have
+    their data replaced for every planet.
+
+    Attributes:
+            figure (:obj:`matplotlib.figure.Figure`): the reused figure.
+            ax (:obj:`matplotlib.axes.Axes`): the reused axis.
+    """
+
+    def __init__(self, figsize=(4, 3), dpi=100, xscale='log', header=None,
+                 verbose=False):
+        """
+        Args:
+                figsize (tuple): figure size in inches.
+                dpi (int): resolution of the rasterized output.
+                xscale (str): x-axis scale of the plots.
+                header (:obj:`list` of :obj:`str`, optional): spectra columns,
+                        in the same order as `exoMAST_API.header`.
+                verbose (bool): print progress messages.
+        """
+        self.verbose = verbose
+        self.header = header
+        self.dpi = dpi
+
+        self.figure = Figure(figsize=figsize, dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        self.ax = self.figure.add_subplot(111)
+        self.figure.subplots_adjust(left=0.2, bottom=0.15)
+        self.ax.set_xscale(xscale)
+
+        # Placeholder data; replaced in place by `update`
+        container = self.ax.errorbar([1.], [1.], [0.], fmt='o', capsize=0)
+        self._data_line = container.lines[0]
+        self._error_lines = container.lines[2][0]
+        self._title = self.ax.set_title('')
+
+    def update(self, planet):
+        """Replace the plotted data with the spectrum of `planet`."""
+        if planet.planetary_spectra_table is None:
+            planet.get_spectra()
+
+        header = self.header
+        if header is None:
+            header = list(planet.header)
+
+        if len(header) == 4:
+            # assume same order as exoMAST_API.header
+            header = [header[0], header[2], header[3]]
+
+        table = planet.planetary_spectra_table
+        wavelength = table[header[0]].values
+        depth = table[header[1]].values
+        uncertainty = table[header[2]].values
+
+        self._data_line.set_data(wavelength, depth)
+
+        segments = np.empty((wavelength.size, 2, 2))
+        segments[:, :, 0] = wavelength[:, None]
+        segments[:, 0, 1] = depth - uncertainty
+        segments[:, 1, 1] = depth + uncertainty
+        self._error_lines.set_segments(segments)
+
+        self._title.set_text(planet.planet_name)
+
+        # Collections are ignored by `relim`; set the limits explicitly
+        if wavelength.size:
+            x_lower, x_upper = np.nanmin(wavelength), np.nanmax(wavelength)
+            y_lower = np.nanmin(depth - uncertainty)
+            y_upper = np.nanmax(depth + uncertainty)
+
+            if self.ax.get_xscale() == 'log' and x_lower > 0:
+                x_pad = max((x_upper / x_lower) ** 0.05, 1.1)
+                self.ax.set_xlim(x_lower / x_pad, x_upper * x_pad)
+            else:
+                x_pad = 0.05 * (x_upper - x_lower) or 0.5
+                self.ax.set_xlim(x_lower - x_pad, x_upper + x_pad)
+
+            y_pad = 0.05 * (y_upper - y_lower) or 0.5 * abs(y_upper) or 1.
+            self.ax.set_ylim(y_lower - y_pad, y_upper + y_pad)
+
+    def render(self, planet, filename):
+        """Draw the spectrum of `planet` and write it to `filename`; the file
+        format (e.g. png, svg) follows the file extension.
+        """
+        if self.verbose:
+            info_message('Rendering Planetary Spectral Plot to {}'.format(
+                filename))
+
+        self.update(planet)
+        self.figure.savefig(filename, dpi=self.dpi)
+
+        return filename
+
+
+def _plot_filename(planet, output_dir, fmt):
+    planet_name_ = planet.planet_name.replace(' ', '_')
+    return '{}/{}.{}'.format(output_dir, planet_name_, fmt)
+
+
+def _render_chunk(planets, output_dir, fmt, renderer_kwargs):
+    """Render a list of planets inside one (worker) process."""
+    global _worker_renderer, _worker_renderer_kwargs
+
+    if _worker_renderer is None or _worker_renderer_kwargs != renderer_kwargs:
+        _worker_renderer = exoMAST_SpectraRenderer(**renderer_kwargs)
+        _worker_renderer_kwargs = renderer_kwargs
+
+    filenames = []
+    for planet in planets:
+        try:
+            if not isinstance(planet, exoMAST_API):
+                planet = exoMAST_API(planet)
+
+            filename = _plot_filename(planet, output_dir, fmt)
+            filenames.append(_worker_renderer.render(planet, filename))
+        except Exception as err:
+            warning_message('Could not render {}: {}'.format(
+                getattr(planet, 'planet_name', planet), err))
+            filenames.append(None)
+
+    return filenames
+
+
+def render_spectra_plots(planets, output_dir='.', fmt='png', n_jobs=1,
+                         chunksize=None, **renderer_kwargs):
+    """Batch render spectra plots for many planets into `output_dir`.
+
+    Args:
+            planets (:obj:`list`): exoMAST_API instances or planet names.
+            output_dir (str): directory in which to write the plot files.
+            fmt (str): output file format, e.g. 'png' or 'svg'.
+            n_jobs (int): number of worker processes; each reuses a single
+                    figure for all of the planets that it renders. None uses
+                    `os.cpu_count()`, as `ProcessPoolExecutor` does.
+            chunksize (int, optional): planets per task sent to a worker.
+            renderer_kwargs: passed to `exoMAST_SpectraRenderer`.
+    Returns:
+            list of the files written, in the order of `planets`; None for
+            the planets that could not be rendered.
+    """
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+
+    planets = list(planets)
+
+    if n_jobs is None:
+        n_jobs = os.cpu_count() or 1
+
+    if n_jobs < 1:
+        raise ValueError('n_jobs must be a positive integer or None')
+
+    if n_jobs == 1 or len(planets) <= 1:
+        return _render_chunk(planets, output_dir, fmt, renderer_kwargs)
+
+    if chunksize is None:
+        chunksize = max(1, len(planets) // (4 * n_jobs))
+
+    chunks = [planets[k:k + chunksize]
+              for k in range(0, len(planets), chunksize)]
+
+    filenames = []
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        futures = [executor.submit(_render_chunk, chunk, output_dir, fmt,
+                                   renderer_kwargs)
+                   for chunk in chunks]
+
+        for future in futures:
+            filenames.extend(future.result())
+
+    return filenames
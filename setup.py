@@ -9,4 +9,5 @@ setup(
     description = 'exoMAST API Python Wrapper',
     packages = find_packages(),    
     install_requires = ['numpy >= 1.11.1', 'matplotlib >= 1.5.1'],
+    extras_require = {'redis': ['redis']},
 )
@@ -0,0 +1,131 @@
+"""Round trips through every cache backend, with Redis replaced by a local
+fakeredis stand-in.
+"""
+import os
+import pickle
+import tempfile
+
+import pytest
+
+from exomast_api import (DirectoryCache, MemoryCache, RedisCache,
+                         SQLiteCache, get_cache_backend)
+from exomast_api.cache_backends import CACHE_BACKEND_ENV, CACHE_LOCATION_ENV
+
+fakeredis = pytest.importorskip('fakeredis')
+
+cache_key = 'HD_189733_b.exomast.joblib.save'
+cache_value = {'planet_name': 'HD 189733 b', 'Rp_Rs': 0.155,
+               'content': b'1.0 0.01 0.02 0.0001\n'}
+
+
+def make_backends():
+    cache_dir = tempfile.mkdtemp()
+    return [MemoryCache({}),
+            DirectoryCache(cache_dir),
+            SQLiteCache(cache_dir + '/exomast_api.sqlite'),
+            RedisCache(client=fakeredis.FakeRedis())]
+
+
+@pytest.mark.parametrize('cache', make_backends(),
+                         ids=lambda cache: cache.__class__.__name__)
+def test_round_trip(cache):
+    assert cache.get(cache_key) is None
+    assert cache_key not in cache
+
+    cache.set(cache_key, cache_value)
+    assert cache.get(cache_key) == cache_value
+    assert cache_key in cache
+
+    cache.set(cache_key, {'Rp_Rs': 0.156})
+    assert cache.get(cache_key) == {'Rp_Rs': 0.156}
+
+    cache.delete(cache_key)
+    assert cache.get(cache_key) is None
+    assert cache_key not in cache
+
+    # Deleting a missing key is not an error
+    cache.delete(cache_key)
+
+
+def test_memory_cache_copies_values():
+    cache = MemoryCache({})
+    value = {'Rp_Rs': [0.155]}
+    cache.set(cache_key, value)
+
+    value['Rp_Rs'].append(0.156)
+    assert cache.get(cache_key) == {'Rp_Rs': [0.155]}
+
+
+def test_redis_cache_prefix_and_pickle():
+    client = fakeredis.FakeRedis()
+    cache = RedisCache('redis://localhost:6379/1', client=client,
+                       prefix='test:')
+    cache.set(cache_key, cache_value)
+    assert client.get('test:' + cache_key) is not None
+
+    # Injected clients are dropped and rebuilt from `url` when pickled
+    pytest.importorskip('redis')
+    unpickled = pickle.loads(pickle.dumps(cache))
+    assert unpickled.client is not client
+    assert unpickled.url == 'redis://localhost:6379/1'
+    assert unpickled.prefix == 'test:'
+
+
+def test_delete_in_missing_directory():
+    DirectoryCache(tempfile.mkdtemp() + '/missing').delete(cache_key)
+
+
+@pytest.mark.parametrize('name, location, backend_class', [
+    ('memory', None, MemoryCache),
+    ('directory', 'cache_dir', DirectoryCache),
+    ('sqlite', 'exomast_api.sqlite', SQLiteCache),
+])
+def test_get_cache_backend_from_environment(monkeypatch, name, location,
+                                            backend_class):
+    home = tempfile.mkdtemp()
+    monkeypatch.setenv('HOME', home)
+    monkeypatch.setenv(CACHE_BACKEND_ENV, name.upper())
+    if location is None:
+        monkeypatch.delenv(CACHE_LOCATION_ENV, raising=False)
+    else:
+        location = '{}/{}'.format(home, location)
+        monkeypatch.setenv(CACHE_LOCATION_ENV, location)
+
+    cache = get_cache_backend()
+    assert isinstance(cache, backend_class)
+
+    if backend_class is DirectoryCache:
+        assert cache.cache_dir == location
+    if backend_class is SQLiteCache:
+        assert cache.filename == location
+
+    cache.set(cache_key, cache_value)
+    assert cache.get(cache_key) == cache_value
+
+
+def test_get_cache_backend_redis_from_environment(monkeypatch):
+    pytest.importorskip('redis')
+    monkeypatch.setenv(CACHE_BACKEND_ENV, 'redis')
+    monkeypatch.setenv(CACHE_LOCATION_ENV, 'redis://cachehost:6380/2')
+
+    # Creating the client does not connect to the server
+    cache = get_cache_backend()
+    assert isinstance(cache, RedisCache)
+    assert cache.url == 'redis://cachehost:6380/2'
+
+
+def test_get_cache_backend_defaults(monkeypatch):
+    home = tempfile.mkdtemp()
+    monkeypatch.setenv('HOME', home)
+    monkeypatch.delenv(CACHE_BACKEND_ENV, raising=False)
+    monkeypatch.delenv(CACHE_LOCATION_ENV, raising=False)
+
+    cache = get_cache_backend()
+    assert isinstance(cache, DirectoryCache)
+    assert cache.cache_dir == home + '/.exomast_api'
+
+    memory = MemoryCache({})
+    assert get_cache_backend(memory) is memory
+
+    with pytest.raises(ValueError):
+        get_cache_backend('memcached')
@@ -0,0 +1,114 @@
+"""Stress test for concurrent writers and readers of the directory cache.
+
+Run with `python -m pytest tests` or directly with
+`python tests/test_cache_concurrency.py`.
+"""
+import os
+import stat
+import tempfile
+
+from multiprocessing import Pool
+
+from exomast_api import exoMAST_API, DirectoryCache
+
+n_processes = 16
+n_writes = 30
+payload_size = 20000
+cache_key = 'HD_189733_b.exomast.joblib.save'
+
+
+def _write_and_read(args):
+    """Repeatedly set and get the same key; return whether every read was a
+    complete dict.
+    """
+    cache_dir, worker = args
+    cache = DirectoryCache(cache_dir)
+
+    complete = []
+    for k in range(n_writes):
+        cache.set(cache_key, {'worker': worker, 'write': k,
+                              'payload': list(range(payload_size))})
+
+        value = cache.get(cache_key)
+        complete.append(isinstance(value, dict) and
+                        value.get('payload') == list(range(payload_size)))
+
+    return all(complete)
+
+
+def test_concurrent_writers():
+    cache_dir = tempfile.mkdtemp() + '/cache/nested'
+
+    with Pool(n_processes) as pool:
+        results = pool.map(_write_and_read,
+                           [(cache_dir, worker)
+                            for worker in range(n_processes)])
+
+    assert all(results)
+
+    # No temporary files are left behind by the atomic writes
+    assert sorted(os.listdir(cache_dir)) == [cache_key, cache_key + '.lock']
+
+    value = DirectoryCache(cache_dir).get(cache_key)
+    assert value['payload'] == list(range(payload_size))
+
+
+def test_saved_file_mode():
+    cache_dir = tempfile.mkdtemp()
+    DirectoryCache(cache_dir).set(cache_key, {})
+
+    umask = os.umask(0)
+    os.umask(umask)
+
+    mode = stat.S_IMODE(os.stat('{}/{}'.format(cache_dir, cache_key)).st_mode)
+    assert mode == 0o666 & ~umask
+
+
+def test_reads_do_not_lock():
+    cache_dir = tempfile.mkdtemp()
+    cache = DirectoryCache(cache_dir)
+    cache.set(cache_key, {'Rp_Rs': 0.155})
+    os.remove(cache.filename(cache_key) + '.lock')
+
+    # Readers open no lock file, so read-only cache directories still work
+    assert cache.get(cache_key) == {'Rp_Rs': 0.155}
+    assert os.listdir(cache_dir) == [cache_key]
+
+
+def test_corrupt_save_is_refetched(monkeypatch):
+    cache = DirectoryCache(tempfile.mkdtemp())
+    fetched = []
+
+    def get_identifiers(self, *args, **kwargs):
+        self._planet_ident_dict = {'canonicalName': self.planet_name}
+
+    def get_properties(self, *args, **kwargs):
+        fetched.append(self.planet_name)
+        self.Rp_Rs = 0.155
+
+    monkeypatch.setattr(exoMAST_API, 'get_identifiers', get_identifiers)
+    monkeypatch.setattr(exoMAST_API, 'get_properties', get_properties)
+
+    exoMAST_API('HD 189733 b', cache=cache)
+    assert len(fetched) == 1
+
+    with open(cache.filename(cache_key), 'wb') as fout:
+        fout.write(b'this is not a joblib pickle')
+
+    planet = exoMAST_API('HD 189733 b', cache=cache, quickstart=True)
+    assert planet.load_instance() is False
+
+    planet = exoMAST_API('HD 189733 b', cache=cache)
+    assert len(fetched) == 2
+    assert planet.Rp_Rs == 0.155
+
+    # The refetched results were saved again and load cleanly
+    assert exoMAST_API('HD 189733 b', cache=cache,
+                       quickstart=True).load_instance() is True
+
+
+if __name__ == '__main__':
+    test_concurrent_writers()
+    test_saved_file_mode()
+    print('{} processes x {} writes: every read was complete'.format(
+        n_processes, n_writes))
@@ -0,0 +1,220 @@
+"""Conditional, ranged and windowed downloads through a stub `requests_get`
+that serves one spectrum file.
+"""
+import pytest
+
+from exomast_api import exoMAST_API, CacheBackend, MemoryCache
+from exomast_api import exomast_api as exomast_module
+from exomast_api.exomast_api import http_cache_key
+
+n_rows = 300
+
+
+def make_body(uncertainty):
+    rows = ['{:.2f} 0.01 0.02 {}'.format(1 + 0.01 * k, uncertainty)
+            for k in range(n_rows)]
+    return ('# Wavelength Delta (Rp/Rs)^2 Uncertainty\n' +
+            '\n'.join(rows) + '\n').encode('utf-8')
+
+
+class StubResponse(object):
+
+    def __init__(self, server, status_code, body=b'', headers=None):
+        self.server = server
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.headers = headers or {}
+        self.body = body
+
+    def iter_content(self, chunk_size=1):
+        chunk_size = 512  # small chunks make early stops measurable
+        for start in range(0, len(self.body), chunk_size):
+            chunk = self.body[start:start + chunk_size]
+            self.server.bytes_sent += len(chunk)
+            yield chunk
+
+    def close(self):
+        pass
+
+
+class StubServer(object):
+    """Serves `body` with an ETag, honouring If-None-Match and
+    Range/If-Range unless told otherwise.
+    """
+
+    def __init__(self):
+        self.body = make_body(0.001)
+        self.etag = '"v1"'
+        self.honour_range = True
+        self.force_416 = False
+        self.content_encoding = None
+        self.requests = []
+        self.bytes_sent = 0
+
+    def get(self, url, headers=None, stream=False):
+        headers = headers or {}
+        self.requests.append(dict(headers))
+
+        response_headers = {'ETag': self.etag, 'Accept-Ranges': 'bytes'}
+        if self.content_encoding:
+            response_headers['Content-Encoding'] = self.content_encoding
+
+        if headers.get('If-None-Match') == self.etag:
+            return StubResponse(self, 304, headers=response_headers)
+
+        if 'Range' in headers and self.force_416:
+            return StubResponse(self, 416, headers=response_headers)
+
+        if 'Range' in headers and self.honour_range and \
+                headers.get('If-Range') == self.etag:
+            start = int(headers['Range'][len('bytes='):-1])
+            return StubResponse(self, 206, self.body[start:],
+                                response_headers)
+
+        return StubResponse(self, 200, self.body, response_headers)
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = StubServer()
+    monkeypatch.setattr(exomast_module, 'requests_get', server.get)
+    return server
+
+
+def get_spectra(cache, wavelength_range=None):
+    planet = exoMAST_API('HD 189733 b', quickstart=True, cache=cache)
+    planet._spectra_filelist = {'filenames': ['spectrum.txt']}
+    planet.get_spectra(wavelength_range=wavelength_range)
+    return planet.planetary_spectra_table
+
+
+def spectrum_record(cache):
+    url = '{}/spectra/HD%20189733%20b/file/spectrum.txt'.format(
+        exoMAST_API('HD 189733 b', quickstart=True).api_url)
+    return cache.get(http_cache_key(url))
+
+
+def test_full_download_then_not_modified(server):
+    cache = MemoryCache({})
+    table = get_spectra(cache)
+    assert len(table) == n_rows
+    assert server.bytes_sent == len(server.body)
+
+    table = get_spectra(cache)
+    assert len(table) == n_rows
+    assert server.requests[-1]['If-None-Match'] == '"v1"'
+    assert server.bytes_sent == len(server.body)  # 304: nothing new sent
+
+
+def test_identity_encoding_is_requested(server):
+    cache = MemoryCache({})
+    get_spectra(cache, (1.0, 1.5))
+    get_spectra(cache, (1.0, 3.0))
+    assert all(headers['Accept-Encoding'] == 'identity'
+               for headers in server.requests)
+
+
+def test_window_stops_early(server):
+    cache = MemoryCache({})
+    table = get_spectra(cache, (1.2, 1.5))
+
+    assert table.iloc[0, 0] == 1.2
+    assert table.iloc[-1, 0] == 1.5
+    assert len(table) == 31
+    assert server.bytes_sent < len(server.body) / 2
+    assert spectrum_record(cache)['complete'] is False
+
+
+def test_partial_copy_is_resumed_with_range(server):
+    cache = MemoryCache({})
+    get_spectra(cache, (1.0, 1.5))
+    partial_length = len(spectrum_record(cache)['content'])
+
+    table = get_spectra(cache, (1.0, 5.0))
+    assert server.requests[-1]['Range'] == 'bytes={}-'.format(partial_length)
+    assert server.requests[-1]['If-Range'] == '"v1"'
+    assert len(table) == n_rows
+    assert (table.iloc[:, 0].values == [round(1 + 0.01 * k, 2)
+                                        for k in range(n_rows)]).all()
+    assert spectrum_record(cache)['complete'] is True
+
+
+def test_partial_copy_is_revalidated(server):
+    cache = MemoryCache({})
+    get_spectra(cache, (1.0, 1.5))
+    bytes_sent = server.bytes_sent
+
+    # Unchanged: the window is answered by a 304
+    table = get_spectra(cache, (1.0, 1.4))
+    assert server.requests[-1]['If-None-Match'] == '"v1"'
+    assert 'Range' not in server.requests[-1]
+    assert server.bytes_sent == bytes_sent
+    assert len(table) == 41
+
+    # Changed: the window is downloaded again
+    server.body = make_body(0.002)
+    server.etag = '"v2"'
+    table = get_spectra(cache, (1.0, 1.4))
+    assert (table.iloc[:, 3] == 0.002).all()
+    assert spectrum_record(cache)['etag'] == '"v2"'
+
+
+def test_server_ignoring_range_sends_full_payload(server):
+    cache = MemoryCache({})
+    get_spectra(cache, (1.0, 1.5))
+
+    server.honour_range = False
+    server.body = make_body(0.002)
+    table = get_spectra(cache)
+    assert len(table) == n_rows
+    assert (table.iloc[:, 3] == 0.002).all()
+
+
+def test_unsatisfiable_range_falls_back_to_full_download(server):
+    cache = MemoryCache({})
+    get_spectra(cache, (1.0, 1.5))
+
+    server.force_416 = True
+    table = get_spectra(cache)
+    assert 'Range' in server.requests[-2]
+    assert 'Range' not in server.requests[-1]
+    assert len(table) == n_rows
+    assert spectrum_record(cache)['complete'] is True
+
+
+def test_complete_copy_is_not_replaced_by_partial(server):
+    cache = MemoryCache({})
+    get_spectra(cache)
+
+    server.body = make_body(0.002)
+    server.etag = '"v2"'
+    table = get_spectra(cache, (1.0, 1.5))
+    assert (table.iloc[:, 3] == 0.002).all()
+    assert spectrum_record(cache)['complete'] is True
+
+    table = get_spectra(cache)
+    assert len(table) == n_rows
+    assert (table.iloc[:, 3] == 0.002).all()
+    assert spectrum_record(cache)['etag'] == '"v2"'
+
+
+def test_compressed_responses_are_not_resumed(server):
+    cache = MemoryCache({})
+    server.content_encoding = 'gzip'
+    get_spectra(cache, (1.0, 1.5))
+    assert spectrum_record(cache)['accept_ranges'] is False
+
+    get_spectra(cache, (1.0, 5.0))
+    assert 'Range' not in server.requests[-1]
+
+
+def test_cache_failures_do_not_fail_downloads(server):
+    class UnavailableCache(CacheBackend):
+        def get(self, key):
+            raise ConnectionError('cache is down')
+
+        def set(self, key, value):
+            raise ConnectionError('cache is down')
+
+    table = get_spectra(UnavailableCache(), (1.0, 1.5))
+    assert len(table) == 51